@@ -0,0 +1,11 @@
+from numba.pycc import CC
+
+import modulation_identifier
+
+# Ahead of time build of the branch feature kernel, so a fresh process can use
+# it without waiting for numba's compilation. Run with: python aot_build.py
+cc = CC("_branch_variance_aot")
+cc.export("branch_variance", "f8(f4[::1])")(modulation_identifier._branch_variance_kernel)
+
+if __name__ == "__main__":
+    cc.compile()
@@ -1,24 +1,190 @@
+import multiprocessing, os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain
+from typing import Union
 import numpy as np
 from numpy import ndarray
 import matplotlib.pyplot as plt
 from pyphysim.modulators import fundamental
 from pyphysim.util.conversion import dB2Linear
-from pyphysim.util.misc import randn_c
+from numba import guvectorize, njit, prange, set_num_threads
+
+# Maximum number of samples simulated at once by a chunk of a noise sweep, bounds the memory used.
+# It alone sets the chunks, so a seeded sweep gives the same results on any number of cores
+SWEEP_CHUNK_SAMPLES = 2**22
+# Largest simulation, in samples, whose output buffers the simulator keeps to reuse (3 buffers of 8 MB)
+SCRATCH_MAX_SAMPLES = 2**20
+
+@lru_cache(maxsize=None)
+def _noise_std(noise : int) -> float:
+    """Convert a noise level to the standard deviation of the AWGN, cached as the levels used are few integers
+
+    Args:
+        noise (int): noise level in dB
+
+    Returns:
+        float: standard deviation of the noise
+    """
+    return np.sqrt(1 / dB2Linear(noise))
+
+@njit(parallel=True, cache=True)
+def _ser(demodulated_data : ndarray, data : ndarray) -> float:
+    """Calculate the Symbol Error Rate counting the mismatches in a single pass
+
+    Args:
+        demodulated_data (ndarray): 1-D array with the demodulated data
+        data (ndarray): 1-D array with the original data
+
+    Returns:
+        float: the SER
+    """
+    n = data.shape[0]
+    errors = 0
+    for i in prange(n):
+        errors += demodulated_data[i] != data[i]
+    return errors / n
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _demodulate(received_real : ndarray, received_imag : ndarray, table_real : ndarray, table_imag : ndarray) -> ndarray:
+    """Demodulate each received sample to the index of the nearest constellation symbol
+
+    The real and imaginary parts are passed as separate float arrays, taking them
+    from complex values inside the parallel loop crashes the LLVM used by Numba.
+
+    Args:
+        received_real (ndarray): 1-D array with the real part of the received data
+        received_imag (ndarray): 1-D array with the imaginary part of the received data
+        table_real (ndarray): real part of the constellation symbols
+        table_imag (ndarray): imaginary part of the constellation symbols
+
+    Returns:
+        ndarray: array with the demodulated data
+    """
+    demodulated_data = np.empty(received_real.shape[0], np.int64)
+    for i in prange(received_real.shape[0]):
+        # Start from the first symbol, an infinite sentinel is undefined under fastmath
+        best = 0
+        best_distance = (received_real[i] - table_real[0]) ** 2 + (received_imag[i] - table_imag[0]) ** 2
+        for k in range(1, table_real.shape[0]):
+            distance = (received_real[i] - table_real[k]) ** 2 + (received_imag[i] - table_imag[k]) ** 2
+            if distance < best_distance:
+                best_distance = distance
+                best = k
+        demodulated_data[i] = best
+    return demodulated_data
+
+@guvectorize(["void(complex64[:], complex64[:], complex64[:])", "void(complex128[:], complex128[:], complex128[:])"],
+             "(n),(n)->(n)", target="parallel", nopython=True)
+def _add_noise(modulated_data : ndarray, noise : ndarray, noisy_data : ndarray) -> None:
+    """Add the channel noise to the modulated data, as a multi-core generalized ufunc
+
+    Args:
+        modulated_data (ndarray): modulated data
+        noise (ndarray): noise samples
+        noisy_data (ndarray): output with the noisy data
+    """
+    for i in range(modulated_data.shape[0]):
+        noisy_data[i] = modulated_data[i] + noise[i]
+
+_worker_simulator = None
+_worker_data = None
+
+def _init_worker(simulator : "DataTransmissionSimulator", data : ndarray) -> None:
+    """Store the simulator and the data used by the tasks of a worker process
+
+    Args:
+        simulator (DataTransmissionSimulator): the simulator sent once to each worker
+        data (ndarray): the data transmitted for every noise level
+    """
+    global _worker_simulator, _worker_data
+    _worker_simulator = simulator
+    _worker_data = data
+    # The cores are already shared among the workers, more Numba threads would oversubscribe them
+    set_num_threads(1)
+
+def _simulate_noise_levels(noise_stds : ndarray, bit_generator : np.random.PCG64) -> list[tuple[float,float]]:
+    """Simulate a chunk of noise levels of a sweep in a worker process
+
+    Args:
+        noise_stds (ndarray): Standard deviations of the noise
+        bit_generator (np.random.PCG64): random stream of the task, jumped so the chunks don't share samples
+
+    Returns:
+        list[tuple[float, float]]: (average SER for QAM, average SER for PSK) for each noise level
+    """
+    return _worker_simulator._simulate_chunk(_worker_data, noise_stds, bit_generator)
 
 class DataTransmissionSimulator():
     """Class used to generate all data to transmit, as well as  the modulation objects
     """    
-    def __init__(self, num_symbols : int, num_symbols_transmit : int) -> None:
+    def __init__(self, num_symbols : int, num_symbols_transmit : int, seed : int = None) -> None:
         """
 
         Args:
             num_symbols (int): Number of symbols supported, 256, for example, would mean a 256-QAM and 256-PSK
             num_symbols_transmit (int): How much data should be created to transmit
+            seed (int, optional): Seed of the random generator, for reproducible simulations. Defaults to None.
         """             
         self.num_symbols = num_symbols
         self.num_symbols_transmit = num_symbols_transmit
+        self._rng = np.random.Generator(np.random.PCG64(seed))
+        # Output buffers of the simulations, reused while the batch shape doesn't change.
+        # Only simulations up to SCRATCH_MAX_SAMPLES are kept, bigger ones allocate their own
+        self._scratch = {}
+        # Figures already drawn, redrawn with new data instead of being built again
+        self._figures = {}
         self.__psk = fundamental.PSK(self.num_symbols)
         self.__qam = fundamental.QAM(self.num_symbols)
+        # The constellations are fixed, modulating is just indexing them. Single precision
+        # is enough for the symbol spacing and halves the memory traffic of the simulations
+        self.__psk_table = self.__psk.symbols.astype(np.complex64)
+        self.__qam_table = self.__qam.symbols.astype(np.complex64)
+        # Smallest integer type able to hold the symbols, uint8 up to 256 symbols
+        self.__data_dtype = np.min_scalar_type(self.num_symbols - 1)
+        # Theoretical SER by noise level, it only depends on the constellations
+        self.__theoretical_ser = {}
+
+        # pyphysim only builds square QAM, the constellation is a side x side grid
+        # and the symbol index of each grid position is stored to demodulate it
+        self.__qam_side = int(round(np.sqrt(self.num_symbols)))
+        self.__qam_offset = self.__qam_table.real.min()
+        self.__qam_step = (self.__qam_table.real.max() - self.__qam_offset) / (self.__qam_side - 1)
+        self.__qam_grid = np.empty(self.num_symbols, np.int64)
+        self.__qam_grid[self.__qam_grid_position(self.__qam_table)] = np.arange(self.num_symbols)
+
+    def __getstate__(self) -> dict:
+        """Leave the scratch buffers and figures out when the simulator is pickled, as when it is sent to the worker processes
+
+        Returns:
+            dict: the simulator attributes
+        """
+        state = self.__dict__.copy()
+        state["_scratch"] = {}
+        state["_figures"] = {}
+        return state
+
+    def __scratch_buffers(self, shape : tuple[int, ...]) -> dict[str, ndarray]:
+        """Get the output buffers for a simulation, allocated only when the shape changes
+
+        Simulations bigger than SCRATCH_MAX_SAMPLES get no buffers, their outputs are
+        allocated for the call and freed with it instead of being held by the simulator.
+
+        Args:
+            shape (tuple[int, ...]): shape of the simulated data
+
+        Returns:
+            dict[str, ndarray]: the buffers by name, empty when the simulation is too big to keep them
+        """
+        if np.prod(shape) > SCRATCH_MAX_SAMPLES:
+            return {}
+        if shape not in self._scratch:
+            self._scratch = {shape: {
+                "noise": np.empty(shape, np.complex64),
+                "noisy_qam": np.empty(shape, np.complex64),
+                "noisy_psk": np.empty(shape, np.complex64),
+            }}
+        return self._scratch[shape]
 
     def generate_data(self) -> ndarray :
         """Generate data to transmit
@@ -26,7 +192,7 @@ class DataTransmissionSimulator():
         Returns:
             ndarray: an array with data to transmit
         """        
-        return np.random.randint(0, self.num_symbols, self.num_symbols_transmit)
+        return self._rng.integers(0, self.num_symbols, self.num_symbols_transmit, dtype=self.__data_dtype)
 
     def modulate_data(self, data : ndarray) -> tuple[ndarray,ndarray]:
         """Generate the modulated data for PSK and QAM
@@ -37,36 +203,60 @@ class DataTransmissionSimulator():
         Returns:
             tuple[ndarray,ndarray]: (array with QAM modulated data, array with PSK modulated data)
         """                    
-        psk_modulated_data = self.__psk.modulate(data)
-        qam_modulated_data = self.__qam.modulate(data)
+        psk_modulated_data = self.__psk_table[data]
+        qam_modulated_data = self.__qam_table[data]
 
         return (qam_modulated_data, psk_modulated_data)
 
-    def __awgn_noise(self, noise : int) -> ndarray :
+    def generate_batch(self, num_transmissions : int, noise : int = 20, out : tuple[ndarray, ndarray] = None) -> tuple[ndarray, ndarray]:
+        """Generate, modulate and transmit many independent blocks of data at once
+
+        Args:
+            num_transmissions (int): number of transmissions, each one with num_symbols_transmit symbols
+            noise (int, optional): The noise to be applied to the data in dB. Defaults to 20dB.
+            out (tuple[ndarray, ndarray], optional): complex64 buffers of shape (num_transmissions, num_symbols_transmit)
+                to write the QAM and PSK data with noise to. Defaults to None.
+
+        Returns:
+            tuple[ndarray, ndarray]: (QAM data with noise, PSK data with noise), one transmission per row
+        """
+        data = self._rng.integers(0, self.num_symbols, (num_transmissions, self.num_symbols_transmit), dtype=self.__data_dtype)
+        buffers = {} if out is None else {"noisy_qam": out[0], "noisy_psk": out[1]}
+        return self.__transmit_data(*self.modulate_data(data), _noise_std(noise), buffers)
+
+    def __awgn_noise(self, noise_std : Union[float, ndarray], shape : tuple[int, ...], out : ndarray = None) -> ndarray :
         """Generate White Gaussian Noise
 
         Args:
-            noise (int): noise level in dB
+            noise_std (float | ndarray): standard deviation of the noise, sqrt(1 / dB2Linear(noise in dB)), or an array of them broadcast with shape
+            shape (tuple[int, ...]): shape of the data the noise will be added to
+            out (ndarray, optional): complex64 buffer to generate the noise in. Defaults to None.
 
         Returns:
             ndarray: array with noisy data to be added with another array
         """    
-        noise_power = 1 / dB2Linear(noise)
-        n = randn_c(self.num_symbols_transmit)
-        return n * np.sqrt(noise_power)
+        n = np.empty(shape, np.complex64) if out is None else out
+        # The real and imaginary parts are drawn at once, straight into the complex array seen as floats
+        self._rng.standard_normal(dtype=np.float32, out=n.view(np.float32))
+        n *= np.asarray(noise_std / np.sqrt(2), dtype=np.float32)
+        return n
 
     def __phase_noise(self):
-        return np.exp(1j * np.random.randn(self.num_symbols_transmit))
+        return np.exp(1j * self._rng.standard_normal(self.num_symbols_transmit))
     
     def print_constellations(self):
         """Display the constellations used for both QAM and PSK
         """        
         print(self.__qam.symbols.real)
-        plt.plot(self.__qam.symbols.real, self.__qam.symbols.imag, '.', label="QAM")
-        plt.plot(self.__psk.symbols.real, self.__psk.symbols.imag, '.', label="PSK")
-        plt.legend(loc='upper center', bbox_to_anchor=(0.5, 1.1),
-          fancybox=True, shadow=True, ncol=5)
-        plt.grid(True)
+        figure = self._figures.get("constellations")
+        if figure is None or not plt.fignum_exists(figure.number):
+            figure = plt.figure()
+            plt.plot(self.__qam.symbols.real, self.__qam.symbols.imag, '.', label="QAM")
+            plt.plot(self.__psk.symbols.real, self.__psk.symbols.imag, '.', label="PSK")
+            plt.legend(loc='upper center', bbox_to_anchor=(0.5, 1.1),
+              fancybox=True, shadow=True, ncol=5)
+            plt.grid(True)
+            self._figures["constellations"] = figure
         plt.show()
     
     def transmit_data(self, qam_modulated_data : ndarray, psk_modulated_data : ndarray, noise : int = 20) -> tuple [ndarray, ndarray]:
@@ -80,9 +270,26 @@ class DataTransmissionSimulator():
         Returns:
             tuple [ndarray, ndarray]: (QAM ndarray data with noise, PSK ndarray with noise)
         """            
-        channel_awg_noise = self.__awgn_noise(noise)
-        noisy_qam = qam_modulated_data + channel_awg_noise
-        noisy_psk = psk_modulated_data + channel_awg_noise
+        return self.__transmit_data(qam_modulated_data, psk_modulated_data, _noise_std(noise))
+
+    def __transmit_data(self, qam_modulated_data : ndarray, psk_modulated_data : ndarray, noise_std : Union[float, ndarray], out : dict[str, ndarray] = None) -> tuple [ndarray, ndarray]:
+        """Transmit the generated data through a channel with AWGN of a given standard deviation
+
+        Args:
+            qam_modulated_data (ndarray): Data already modulated with QAM
+            psk_modulated_data (ndarray): Data already modulated with PSK
+            noise_std (float | ndarray): Standard deviation of the noise. An array of them, with
+                trailing axes of size 1, transmits the data once for each standard deviation
+            out (dict[str, ndarray], optional): Scratch buffers to write the noisy data to. Defaults to None.
+
+        Returns:
+            tuple [ndarray, ndarray]: (QAM ndarray data with noise, PSK ndarray with noise)
+        """            
+        out = {} if out is None else out
+        shape = np.broadcast_shapes(np.shape(noise_std), qam_modulated_data.shape)
+        channel_awg_noise = self.__awgn_noise(noise_std, shape, out.get("noise"))
+        noisy_qam = _add_noise(qam_modulated_data, channel_awg_noise, out=out.get("noisy_qam"))
+        noisy_psk = _add_noise(psk_modulated_data, channel_awg_noise, out=out.get("noisy_psk"))
 
         return (noisy_qam, noisy_psk)
     
@@ -96,11 +303,29 @@ class DataTransmissionSimulator():
         Returns:
             tuple[ndarray, ndarray]: (QAM data demodulated, PSK data demodulated)
         """           
-        qam_demodulated_data = self.__qam.demodulate(qam_data)
-        psk_demodulated_data = self.__psk.demodulate(psk_data)
+        qam_flat = qam_data.ravel()
+        psk_flat = psk_data.ravel()
+        qam_demodulated_data = self.__qam_grid[self.__qam_grid_position(qam_flat)]
+        psk_demodulated_data = _demodulate(psk_flat.real, psk_flat.imag, self.__psk_table.real, self.__psk_table.imag)
+
+        return (qam_demodulated_data.reshape(qam_data.shape), psk_demodulated_data.reshape(psk_data.shape))
+
+
+    def __qam_grid_position(self, qam_data : ndarray) -> ndarray:
+        """Find the position in the QAM grid nearest to each sample
+
+        On a square grid the nearest symbol is found rounding the real and the
+        imaginary parts independently, without comparing the distances to every symbol.
 
-        return (qam_demodulated_data, psk_demodulated_data)
+        Args:
+            qam_data (ndarray): 1-D array with the QAM data
 
+        Returns:
+            ndarray: array with the grid positions, row * side + column
+        """
+        columns = np.clip(np.rint((qam_data.real - self.__qam_offset) / self.__qam_step), 0, self.__qam_side - 1)
+        rows = np.clip(np.rint((qam_data.imag - self.__qam_offset) / self.__qam_step), 0, self.__qam_side - 1)
+        return (rows * self.__qam_side + columns).astype(np.int64)
 
     def symbol_error_rate(self, data : ndarray, qam_demodulated_data : ndarray, psk_demodulated_data : ndarray) -> tuple[float,float]:
         """Calculate the Symbol Error Rate for QAM and PSK
@@ -113,7 +338,8 @@ class DataTransmissionSimulator():
         Returns:
             tuple[float, float]: (SER for QAM, SER for PSK)
         """                
-        return (1 - sum(qam_demodulated_data == data) / self.num_symbols_transmit, 1 - sum(psk_demodulated_data == data) / self.num_symbols_transmit)
+        data = data.ravel()
+        return (_ser(qam_demodulated_data.ravel(), data), _ser(psk_demodulated_data.ravel(), data))
         # qam_error = sum(qam_demodulated_data != data)
         # psk_error = sum(psk_demodulated_data != data)
 
@@ -127,6 +353,9 @@ class DataTransmissionSimulator():
     def simulate(self, num_rep : int = 5000, noise = 20) -> tuple[float,float]:
         """Simulate multiple transmission
 
+        All the transmissions are simulated at once, each row of the generated
+        (num_rep, num_symbols_transmit) array being one transmission.
+
         Args:
             num_rep (int, optional): Number of transmissions to simulate. Defaults to 5000.
             noise (int, optional): Noise in dB. Defaults to 20dB.
@@ -134,21 +363,47 @@ class DataTransmissionSimulator():
         Returns:
             tuple[float, float]: (average SER for QAM, average SER for PSK)
         """          
-        qam_ser = 0
-        psk_ser = 0
-
-        for rep in range(num_rep):
-            data = self.generate_data()
-            qam_mod_data, psk_mod_data = self.modulate_data(data)
-            qam_data, psk_data = self.transmit_data(qam_mod_data, psk_mod_data, noise)
-            qam_demo, psk_demo = self.demodulate(qam_data, psk_data)
-            qam_result, psk_result = self.symbol_error_rate(data, qam_demo, psk_demo)
-            qam_ser += qam_result
-            psk_ser += psk_result
-
-        return (qam_ser/num_rep, psk_ser/num_rep)
+        data = self._rng.integers(0, self.num_symbols, (num_rep, self.num_symbols_transmit), dtype=self.__data_dtype)
+        return self._simulate(data, np.array([_noise_std(noise)]))[0]
+
+    def _simulate(self, data : ndarray, noise_stds : ndarray) -> list[tuple[float,float]]:
+        """Simulate the transmission of the same data with AWGN of several standard deviations
+
+        The noise of every level is generated at once, as a (len(noise_stds), *data.shape)
+        array broadcast with the modulated data.
+
+        Args:
+            data (ndarray): Data to transmit, one transmission per row
+            noise_stds (ndarray): Standard deviations of the noise
+
+        Returns:
+            list[tuple[float, float]]: (average SER for QAM, average SER for PSK) for each noise level
+        """          
+        qam_mod_data, psk_mod_data = self.modulate_data(data)
+        noise_stds = noise_stds.reshape((-1,) + (1,) * data.ndim)
+        scratch = self.__scratch_buffers(noise_stds.shape[:1] + data.shape)
+        qam_data, psk_data = self.__transmit_data(qam_mod_data, psk_mod_data, noise_stds, scratch)
+        qam_demo, psk_demo = self.demodulate(qam_data, psk_data)
+
+        # Every transmission has the same size, so the mean over all symbols
+        # is the average of the SER of each transmission
+        return [self.symbol_error_rate(data, qam_demo[level], psk_demo[level]) for level in range(len(noise_stds))]
     
-    def simulate_range_noise(self, initial_noise : int, final_noise : int, num_rep : int = 5000) -> tuple[list[float],list[float]]:
+    def _simulate_chunk(self, data : ndarray, noise_stds : ndarray, bit_generator : np.random.PCG64) -> list[tuple[float,float]]:
+        """Simulate a chunk of noise levels of a sweep drawing the noise from the given random stream
+
+        Args:
+            data (ndarray): Data to transmit, one transmission per row
+            noise_stds (ndarray): Standard deviations of the noise
+            bit_generator (np.random.PCG64): random stream of the chunk
+
+        Returns:
+            list[tuple[float, float]]: (average SER for QAM, average SER for PSK) for each noise level
+        """
+        self._rng = np.random.Generator(bit_generator)
+        return self._simulate(data, noise_stds)
+
+    def simulate_range_noise(self, initial_noise : int, final_noise : int, num_rep : int = 5000) -> tuple[ndarray,ndarray]:
         """Simulate multiple transmissions with a range of noise values
 
         Args:
@@ -157,15 +412,37 @@ class DataTransmissionSimulator():
             num_rep (int, optional): Number of repetitions. Defaults to 5000.
 
         Returns:
-            tuple[list[float], list[float]]: (list of SER values for each noise value for QAM, list of SER values for each noise value for PSK)
+            tuple[ndarray, ndarray]: (array of SER values for each noise value for QAM, array of SER values for each noise value for PSK)
         """        
-        qam_ser_values = []
-        psk_ser_values = []
-
-        for noise in range(initial_noise, final_noise):
-            qam_ser, psk_ser = self.simulate(num_rep, noise)
-            qam_ser_values.append(qam_ser)
-            psk_ser_values.append(psk_ser)
+        qam_ser_values = np.empty(final_noise - initial_noise)
+        psk_ser_values = np.empty(final_noise - initial_noise)
+        noise_stds = np.array([_noise_std(noise) for noise in range(initial_noise, final_noise)])
+        # The data doesn't depend on the noise, the same transmissions are used for every level
+        data = self._rng.integers(0, self.num_symbols, (num_rep, self.num_symbols_transmit), dtype=self.__data_dtype)
+
+        # The levels are split in chunks of up to SWEEP_CHUNK_SAMPLES, never by the number of cores,
+        # as each chunk has its own random stream and the results must not depend on the machine
+        levels_per_chunk = max(1, SWEEP_CHUNK_SAMPLES // data.size)
+        chunks = [noise_stds[i:i + levels_per_chunk] for i in range(0, len(noise_stds), levels_per_chunk)]
+
+        # Each chunk draws from its own jump of the generator and the
+        # generator moves past all of them, so the streams never overlap
+        bit_generator = self._rng.bit_generator
+        bit_generators = [bit_generator.jumped(jump) for jump in range(1, len(chunks) + 1)]
+        next_rng = np.random.Generator(bit_generator.jumped(len(chunks) + 1))
+
+        if len(chunks) == 1 or os.cpu_count() == 1:
+            # Nothing to run in parallel, the Numba kernels already use every core
+            chunk_results = [self._simulate_chunk(data, chunk, chunk_bit_generator) for chunk, chunk_bit_generator in zip(chunks, bit_generators)]
+        else:
+            # The workers are spawned, forking a process that already started the Numba threads can hang it
+            with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker, initargs=(self, data)) as executor:
+                chunk_results = list(executor.map(_simulate_noise_levels, chunks, bit_generators))
+        self._rng = next_rng
+
+        for level, (qam_ser, psk_ser) in enumerate(chain.from_iterable(chunk_results)):
+            qam_ser_values[level] = qam_ser
+            psk_ser_values[level] = psk_ser
         
         return (qam_ser_values, psk_ser_values)
     
@@ -179,53 +456,70 @@ class DataTransmissionSimulator():
         Returns:
             tuple[float, float]: (SER value for QAM, SER value for PSK)
         """        
-        return (self.__qam.calcTheoreticalSER(noise),self.__psk.calcTheoreticalSER(noise))
+        if noise not in self.__theoretical_ser:
+            self.__theoretical_ser[noise] = (self.__qam.calcTheoreticalSER(noise),self.__psk.calcTheoreticalSER(noise))
+        return self.__theoretical_ser[noise]
     
-    def ser_theoretical_noise_range(self, initial_noise : int, final_noise : int) -> tuple[list[float],list[float]]:
-        """Generate a list with theoretical SER values for QAM and PSK
+    def ser_theoretical_noise_range(self, initial_noise : int, final_noise : int) -> tuple[ndarray,ndarray]:
+        """Generate arrays with theoretical SER values for QAM and PSK
 
         Args:
             initial_noise (int): Minimum accepted noise value
             final_noise (int): Maximum accepted noise value
 
         Returns:
-            tuple[list[float], list[float]]: (list of SER values for each noise value for QAM, list of SER values for each noise value for PSK)
+            tuple[ndarray, ndarray]: (array of SER values for each noise value for QAM, array of SER values for each noise value for PSK)
         """        
-        qam_ser_values = []
-        psk_ser_values = []
-        for noise in range(initial_noise, final_noise):
-            qam_ser, psk_ser = self.ser_theoretical(noise)
-            qam_ser_values.append(qam_ser)
-            psk_ser_values.append(psk_ser)
+        qam_ser_values = np.empty(final_noise - initial_noise)
+        psk_ser_values = np.empty(final_noise - initial_noise)
+        for level, noise in enumerate(range(initial_noise, final_noise)):
+            qam_ser_values[level], psk_ser_values[level] = self.ser_theoretical(noise)
         
         return (qam_ser_values,psk_ser_values)
     
-    def ser_plot(self, qam_ser:list[float], qam_ser_theoretical:list[float], psk_ser:list[float], psk_ser_theoretical:list[float], inital_noise:int, final_noise:int):
+    def ser_plot(self, qam_ser:ndarray, qam_ser_theoretical:ndarray, psk_ser:ndarray, psk_ser_theoretical:ndarray, inital_noise:int, final_noise:int):
         """Plot the SER values comparing the theoretical with the simulated one
 
         Args:
-            qam_ser (list[float]): List SER for the QAM simulation
-            qam_ser_theoretical (list[float]): List theoretical SER values for QAM
-            psk_ser (list[float]): List SER for the PSK simulation
-            psk_ser_theoretical (list[float]): List theoretical SER values for PSK
+            qam_ser (ndarray): SER for the QAM simulation
+            qam_ser_theoretical (ndarray): Theoretical SER values for QAM
+            psk_ser (ndarray): SER for the PSK simulation
+            psk_ser_theoretical (ndarray): Theoretical SER values for PSK
             initial_noise (int): Minimum accepted noise value
             final_noise (int): Maximum accepted noise value
         """        
         
-        noise_list = [noise for noise in range(inital_noise, final_noise)]
-
-        figure, axis = plt.subplots(1, 2)
-        axis[0].plot(noise_list, qam_ser, label="QAM")
-        axis[0].plot(noise_list, qam_ser_theoretical, '.', label="QAM theoretical")
-        axis[0].legend(loc='upper center', bbox_to_anchor=(0.5, 1.1),
-          fancybox=True, shadow=True, ncol=5)
-        axis[0].grid(True)
-
-        axis[1].plot(noise_list, psk_ser, label="PSK")
-        axis[1].plot(noise_list, psk_ser_theoretical, '.', label="PSK theoretical")
-        axis[1].legend(loc='upper center', bbox_to_anchor=(0.5, 1.1),
-          fancybox=True, shadow=True, ncol=5)
-        axis[1].grid(True)
+        noise_list = np.arange(inital_noise, final_noise)
+        ser_values = {
+            "QAM": qam_ser,
+            "QAM theoretical": qam_ser_theoretical,
+            "PSK": psk_ser,
+            "PSK theoretical": psk_ser_theoretical,
+        }
+
+        figure = self._figures.get("ser")
+        if figure is None or not plt.fignum_exists(figure.number):
+            figure, axis = plt.subplots(1, 2)
+            axis[0].plot(noise_list, qam_ser, label="QAM")
+            axis[0].plot(noise_list, qam_ser_theoretical, '.', label="QAM theoretical")
+            axis[0].legend(loc='upper center', bbox_to_anchor=(0.5, 1.1),
+              fancybox=True, shadow=True, ncol=5)
+            axis[0].grid(True)
+
+            axis[1].plot(noise_list, psk_ser, label="PSK")
+            axis[1].plot(noise_list, psk_ser_theoretical, '.', label="PSK theoretical")
+            axis[1].legend(loc='upper center', bbox_to_anchor=(0.5, 1.1),
+              fancybox=True, shadow=True, ncol=5)
+            axis[1].grid(True)
+            self._figures["ser"] = figure
+        else:
+            # Only the data of the lines changes, the axes and legends are kept
+            for axis in figure.axes:
+                for line in axis.get_lines():
+                    line.set_data(noise_list, ser_values[line.get_label()])
+                axis.relim()
+                axis.autoscale_view()
+            figure.canvas.draw_idle()
         plt.show()
 
 
@@ -1,14 +1,12 @@
-import dill, os, random, threading
-from queue import Queue
+import os, pickle
 import pywt, numpy as np
-from scipy.signal import medfilt
-from scipy.stats import norm
+from numba import float32, float64, njit, prange
 
 from modulation import DataTransmissionSimulator as Data
 
 DATA_FOLDER_NAME = "data"
-TRAIN_FILE = f"{DATA_FOLDER_NAME}/train_data.pkl"
-TEST_FILE = f"{DATA_FOLDER_NAME}/test_data.pkl"
+TRAIN_FILE = f"{DATA_FOLDER_NAME}/train_data.npz"
+TEST_FILE = f"{DATA_FOLDER_NAME}/test_data.npz"
 THRESHOLD_FILE = f"{DATA_FOLDER_NAME}/thresholds.pkl"
 
 SYMBOL_NUM = 16
@@ -16,75 +14,139 @@ SYMBOL_NUM_TRANSMIT = int(1e3)
 DATASET_NUM = 500
 THRESHOLD_LIST_SIZE = 300
 
+QAM_LABEL = 0
+PSK_LABEL = 1
+
+_RNG = np.random.default_rng()
+_INV_SQRT_2PI = 1.0 / np.sqrt(2 * np.pi)
+
+@njit
+def _median5(a, b, c, d, e):
+    # Median of 5 values with min/max pairs only, no branches
+    f = max(min(a, b), min(c, d))
+    g = min(max(a, b), max(c, d))
+    return max(min(e, f), min(max(e, f), g))
+
+@njit(cache=True, fastmath=True)
+def _median_filter5(data):
+    # 5 samples median filter, zero padded at the edges as scipy's medfilt
+    padded = np.zeros(data.shape[0] + 4, data.dtype)
+    padded[2:-2] = data
+    filtered = np.empty(data.shape[0], data.dtype)
+    for i in range(data.shape[0]):
+        filtered[i] = _median5(padded[i], padded[i + 1], padded[i + 2], padded[i + 3], padded[i + 4])
+    return filtered
+
+@njit(cache=True, fastmath=True)
+def _median_variance(approximation, padded):
+    # 5 samples median filter with zero padding and variance, fused in a
+    # single pass, padded is a scratch buffer 4 samples longer than the data.
+    # The samples may be single precision, the running sums are always double
+    size = approximation.shape[0]
+    padded[:2] = 0.0
+    padded[-2:] = 0.0
+    padded[2:-2] = approximation
+
+    mean = 0.0
+    m2 = 0.0
+    for i in range(size):
+        value = _median5(padded[i], padded[i + 1], padded[i + 2], padded[i + 3], padded[i + 4])
+        delta = value - mean
+        mean += delta / (i + 1)
+        m2 += delta * (value - mean)
+    return m2 / size
+
+def _branch_variance_kernel(data):
+    # Haar approximation coefficients, median filter and variance. Left
+    # undecorated, it is compiled either by aot_build.py or below
+    size = (data.shape[0] + 1) // 2
+    approximation = np.empty(size, np.float32)
+    for i in range(size):
+        # An odd sized signal is extended repeating its last sample, as pywt does
+        second = data[2 * i + 1] if 2 * i + 1 < data.shape[0] else data[2 * i]
+        approximation[i] = (data[2 * i] + second) * np.float32(0.7071067811865476)
+    return _median_variance(approximation, np.empty(size + 4, np.float32))
+
+try:
+    # Native module built ahead of time by aot_build.py, nothing is compiled at import
+    from _branch_variance_aot import branch_variance as _branch_variance
+except ImportError:
+    # Compiled eagerly for contiguous float32 signals, so the first call does not
+    # pay for the compilation
+    _branch_variance = njit(float64(float32[::1]), cache=True, fastmath=True)(_branch_variance_kernel)
+
+@njit(parallel=True, cache=True, fastmath=True)
+def _median_variances(approximations):
+    # Median filter and variance of every row, the rows are split among
+    # numba's thread pool and each one gets its own padding buffer
+    variances = np.empty(approximations.shape[0])
+    for row in prange(approximations.shape[0]):
+        variances[row] = _median_variance(approximations[row], np.empty(approximations.shape[1] + 4, approximations.dtype))
+    return variances
+
 def amplitude_normalization(data):
-    return data/np.linalg.norm(data)
+    # vdot conjugates the first argument, so its real part is the squared norm
+    return data * (1.0 / np.sqrt(np.vdot(data, data).real))
 
 def haar_wavelet_transform(data):
     return pywt.dwt(data, "haar")
 
 def median_filter(data):
-    return medfilt(np.real(data), kernel_size=5)
-
-def __calculate_threshold(data, attempt, q : Queue):
-    threshold_candidates = {}
-    ran_num = random.uniform(0.0, 0.05)
-    for thr_acc in [1 * ran_num, -1*ran_num]:
-        thr_ini = branch_without_normalization(data[attempt][0]) + thr_acc
-        threshold_candidates[thr_ini] = 0
-
-        for mod in data:
-            var = branch_without_normalization(mod[0])
-            
-            if var < thr_ini:
-                threshold_candidates[thr_ini] += 1 if "PSK" == mod[1] else 0
-            else:
-                threshold_candidates[thr_ini] += 1 if "QAM" == mod[1] else 0
-            
-    q.put(threshold_candidates)
+    return _median_filter5(np.ascontiguousarray(np.real(data), dtype=np.float32))
+
+def haar_approximations(signals):
+    # Haar approximation coefficients of every signal (row) at once, in single precision
+    real = np.real(signals).astype(np.float32, copy=False)
+    if real.shape[-1] % 2:
+        real = np.concatenate([real, real[..., -1:]], axis=-1)
+    return (real[..., ::2] + real[..., 1::2]) * np.float32(np.sqrt(0.5))
+
+def branches_without_normalization(signals):
+    # Same as branch_without_normalization for each signal (row)
+    return _median_variances(haar_approximations(signals))
 
 def threshold_calculation(num_sym, num_sym_transmit, num_gen_data):
     attempts = num_gen_data
     transmission = Data(num_sym, num_sym_transmit)
-    data = []
-    threshold_candidates = {}
-    threads = []
-    q = Queue()
-    
-    for num_gen in range(num_gen_data):
-        data_trans = transmission.generate_data()
-        qam_modulated, psk_modulated = transmission.modulate_data(data_trans)
-        qam_modulated, psk_modulated = transmission.transmit_data(qam_modulated, psk_modulated, 15)
-        data.append((qam_modulated, "QAM"))
-        data.append((psk_modulated, "PSK"))
-    
-    for attempt in range(attempts):
-        thread = threading.Thread(target=__calculate_threshold, args=(data.copy(), attempt, q))
-        thread.start()
-        threads.append(thread)
-    
-    for thread in threads:
-        thread.join()
-    
-    for i in range(q.qsize()):
-        threshold_candidates.update(q.get())
 
-    max_value = max(threshold_candidates.values())
-    return list(filter(lambda x: x[1]==max_value, list(threshold_candidates.items())))[0]
+    # Every transmission at once, written straight into one buffer with the
+    # QAM and PSK signals of each transmission in consecutive rows
+    signals = np.empty((2 * num_gen_data, num_sym_transmit), dtype=np.complex64)
+    transmission.generate_batch(num_gen_data, 15, out=(signals[0::2], signals[1::2]))
+    labels = np.tile(np.array([QAM_LABEL, PSK_LABEL], dtype=np.int8), num_gen_data)
+
+    # The feature of each signal is computed only once, for all of them together
+    return best_threshold(branches_without_normalization(signals), labels, attempts)
+
+def best_threshold(variances, labels, attempts):
+    # Each attempt proposes the feature of one signal, moved up and down by a random amount
+    ran_nums = _RNG.uniform(0.0, 0.05, size=attempts)
+    threshold_candidates = np.column_stack([variances[:attempts] + ran_nums, variances[:attempts] - ran_nums]).ravel()
+
+    # A signal is identified as PSK below the threshold and as QAM above it,
+    # every candidate is scored at once comparing it with all the signals
+    below = variances[np.newaxis, :] < threshold_candidates[:, np.newaxis]
+    predicted = np.where(below, np.int8(PSK_LABEL), np.int8(QAM_LABEL))
+    scores = (predicted == labels).sum(axis=1)
+
+    best = scores.argmax()
+    return (threshold_candidates[best], scores[best])
 
 def variance(data):
     return np.var(data)
 
 def probability_density(data):
-    return norm.pdf(data)
+    # Standard normal density
+    return _INV_SQRT_2PI * np.exp(-0.5 * data * data)
 
 def branch_with_normalization(data):
     normalized_data = amplitude_normalization(data)
     return branch_without_normalization(normalized_data)
 
 def branch_without_normalization(data):
-    data_transformed_ca, data_transformed_cd = haar_wavelet_transform(data)
-    qam_filtered = median_filter(data_transformed_ca)
-    return variance(qam_filtered)
+    # Same as variance(median_filter(haar_wavelet_transform(data)[0])), only
+    # the real part of the data goes through the median filter, in single precision
+    return _branch_variance(np.ascontiguousarray(np.real(data), dtype=np.float32))
 
 def identifier(data, threshold, threshold_normalized):
     var = branch_without_normalization(data)
@@ -94,31 +156,41 @@ def identifier(data, threshold, threshold_normalized):
     else:
         return "QAM"
 
-def generate_datasets(num_symbols, num_symbols_transmit, size):
-    temp = []
-    for i in range(size):
-        data = Data(num_symbols, int(num_symbols_transmit))
-        temp.append((data, data.generate_data()))
+def generate_datasets(num_symbols, num_symbols_transmit, size, noise=15):
+    # One transmitted signal per row and its modulation label, alternating QAM and PSK.
+    # Each transmission fills a QAM row and the next PSK row, all of them generated at once
+    transmission = Data(num_symbols, int(num_symbols_transmit))
+    num_transmissions = (size + 1) // 2
+    signals = np.empty((2 * num_transmissions, int(num_symbols_transmit)), dtype=np.complex64)
+    transmission.generate_batch(num_transmissions, noise, out=(signals[0::2], signals[1::2]))
+    labels = np.tile(np.array([QAM_LABEL, PSK_LABEL], dtype=np.int8), num_transmissions)
 
-    return temp
+    return signals[:size], labels[:size]
 
 def generate_random_thresholds(size):
-    return [random.random() for x in range(size)]
+    return _RNG.random(size)
 
 def save_object(object, path):
-    save_path = os.path.abspath(path)
-    folder_path = "/".join(save_path.split("/")[:-1])
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-    
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
     with open(path, "wb") as datase_file:
-        dill.dump(object, datase_file)
+        pickle.dump(object, datase_file, protocol=5)
 
 def read_object(path):
     with open(path,"rb") as dataset_file:
-        dataset = dill.load(dataset_file)
+        dataset = pickle.load(dataset_file)
     return dataset
 
+def save_datasets(datasets, path):
+    signals, labels = datasets
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    np.savez(path, signals=signals, labels=labels)
+
+def read_datasets(path):
+    with np.load(path) as datasets:
+        return datasets["signals"], datasets["labels"]
+
 def main():
     transmission = Data(16, int(300))
     data = transmission.generate_data()
@@ -135,24 +207,24 @@ def main():
     print(f"th1 : {threshold}, th2 : {threshold_normalized}")
 
     if os.path.exists(os.path.abspath(TRAIN_FILE)):
-        train_data = read_object(TRAIN_FILE)
+        train_data = read_datasets(TRAIN_FILE)
     else:
         train_data = generate_datasets(SYMBOL_NUM,SYMBOL_NUM_TRANSMIT,DATASET_NUM)
-        save_object(train_data, TRAIN_FILE)
+        save_datasets(train_data, TRAIN_FILE)
     
     if os.path.exists(os.path.abspath(TEST_FILE)):
-        test_data = read_object(TEST_FILE)
+        test_data = read_datasets(TEST_FILE)
     else:
         test_data = generate_datasets(SYMBOL_NUM,SYMBOL_NUM_TRANSMIT,DATASET_NUM)
-        save_object(test_data, TEST_FILE)
+        save_datasets(test_data, TEST_FILE)
 
     if os.path.exists(os.path.abspath(THRESHOLD_FILE)):
         thresholds = read_object(THRESHOLD_FILE)
     else:
-        thresholds = []
-        for data in train_data:
-            threshold, threshold_normalized = threshold_calculation(data[1])
-            thresholds.append((threshold, threshold_normalized))
+        # Best threshold over the training signals and how many of them it identifies,
+        # every signal proposes a candidate. The features run on numba's threads
+        signals, labels = train_data
+        thresholds = best_threshold(branches_without_normalization(signals), labels, len(labels))
         save_object(thresholds, THRESHOLD_FILE)
 
     